@@ -0,0 +1,331 @@
+import argparse
+import math
+import re
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+DEFAULT_TOLERANCE = 0.01  # mm
+# Arcs flatter than this are emitted as straight G01 moves instead
+MAX_RADIUS = 5000.0  # mm
+# Shortest run of G01 segments worth replacing with one arc
+MIN_ARC_SEGMENTS = 3
+
+# A plain absolute XY move: "G01 X-4.2 Y9", "G1 Y8.8", ... (no expressions, no other words)
+_XY_MOVE = re.compile(r"^\s*G0?1((?:\s+[XY]\s*[-+]?(?:\d+\.?\d*|\.\d+))+)\s*$", re.IGNORECASE)
+_MOVE = re.compile(r"^\s*(?:N\d+\s+)?G0?[01](?:\s|$)", re.IGNORECASE)
+_AXIS_WORD = re.compile(r"([XYZ])\s*(\[[^\]]*\]|[-+]?(?:\d+\.?\d*|\.\d+))", re.IGNORECASE)
+_MODE_WORD = re.compile(r"\bG(9[01])\b", re.IGNORECASE)
+# Worst-case distance an (x, y) point moves when written with 3 decimals
+_ROUNDING = 0.0005 * math.sqrt(2.0)
+# Lines known not to move the robot: tool/laser, speed and acceleration, dwell, modes, variables
+_NO_MOTION = re.compile(
+    r"^\s*(?:N\d+\s+)?(?:M0?[345]\b|M20[45]\b|M360\b|G0?4\b|G9[01]\b|#)", re.IGNORECASE
+)
+# A line that moves in whatever motion mode is active, without its own G word
+_MODAL_AXES = re.compile(r"^\s*(?:N\d+\s+)?[XYZ]", re.IGNORECASE)
+
+
+def _fmt(value: float) -> str:
+    text = ("%0.3f" % value).rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def _line_errors(windows: np.ndarray) -> np.ndarray:
+    """Max distance of each window's points from the straight move first -> last point.
+
+    `windows` has shape (m, k + 1, 2): m candidate spans of k segments each.
+    """
+    start = windows[:, :1, :]
+    d = windows[:, -1, :] - windows[:, 0, :]
+    length = np.hypot(d[:, 0], d[:, 1])
+    rel = windows - start
+    safe = np.where(length < 1e-9, 1.0, length)
+    along = (rel[:, :, 0] * d[:, None, 0] + rel[:, :, 1] * d[:, None, 1]) / safe[:, None]
+    error = np.abs(rel[:, :, 0] * d[:, None, 1] - rel[:, :, 1] * d[:, None, 0]).max(axis=1) / safe
+    # The path must keep moving forward along the new move
+    backwards = (along[:, 1:] - along[:, :-1]).min(axis=1) < -1e-9
+    return np.where((length < 1e-9) | backwards, np.inf, error)
+
+
+def _circles(windows: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Circle through each window's first, middle and last point: (center, radius, ccw, valid)."""
+    k = windows.shape[1] - 1
+    a, m, b = windows[:, 0, :], windows[:, k // 2, :], windows[:, -1, :]
+    cross = (m[:, 0] - a[:, 0]) * (b[:, 1] - m[:, 1]) - (m[:, 1] - a[:, 1]) * (b[:, 0] - m[:, 0])
+    a2, m2, b2 = (a * a).sum(axis=1), (m * m).sum(axis=1), (b * b).sum(axis=1)
+    den = 2.0 * (a[:, 0] * (m[:, 1] - b[:, 1]) + m[:, 0] * (b[:, 1] - a[:, 1]) + b[:, 0] * (a[:, 1] - m[:, 1]))
+    den = np.where(np.abs(cross) < 1e-12, 1.0, den)
+    cx = (a2 * (m[:, 1] - b[:, 1]) + m2 * (b[:, 1] - a[:, 1]) + b2 * (a[:, 1] - m[:, 1])) / den
+    cy = (a2 * (b[:, 0] - m[:, 0]) + m2 * (a[:, 0] - b[:, 0]) + b2 * (m[:, 0] - a[:, 0])) / den
+    center = np.column_stack([cx, cy])
+    radius = np.hypot(a[:, 0] - cx, a[:, 1] - cy)
+    valid = (np.abs(cross) >= 1e-12) & (radius <= MAX_RADIUS)
+    return center, radius, cross > 0, valid
+
+
+def _arc_errors(windows: np.ndarray) -> np.ndarray:
+    """Max distance between each window's polyline and the arc through its ends and middle."""
+    center, radius, ccw, valid = _circles(windows)
+    rel = windows - center[:, None, :]
+    x, y = rel[:, :, 0], rel[:, :, 1]
+    radial = np.abs(np.hypot(x, y) - radius[:, None])
+    # Signed angle swept by each segment, seen from the center
+    steps = np.arctan2(x[:, :-1] * y[:, 1:] - y[:, :-1] * x[:, 1:], x[:, :-1] * x[:, 1:] + y[:, :-1] * y[:, 1:])
+    steps = np.where(ccw[:, None], steps, -steps)
+    # Points must sweep one way round, less than a full turn
+    one_way = (steps.min(axis=1) > 0) & (steps.sum(axis=1) < 2 * math.pi - 1e-6)
+    # Each chord bulges from the arc by its sagitta, on top of its end points' error
+    sagitta = radius[:, None] * (1.0 - np.cos(steps * 0.5))
+    error = (np.maximum(radial[:, :-1], radial[:, 1:]) + sagitta).max(axis=1)
+    return np.where(valid & one_way, error, np.inf)
+
+
+def _line_error(points: np.ndarray, i: int, j: int) -> float:
+    """Scalar `_line_errors` for the span points[i..j], without the batch overhead."""
+    start, end = points[i], points[j]
+    d = end - start
+    length = math.hypot(d[0], d[1])
+    if length < 1e-9:
+        return math.inf
+    rel = points[i:j + 1] - start
+    along = (rel @ d) / length
+    if len(along) > 2 and (along[1:] - along[:-1]).min() < -1e-9:
+        return math.inf
+    return float(np.abs(rel[:, 0] * d[1] - rel[:, 1] * d[0]).max() / length)
+
+
+def _arc_through(points: np.ndarray, i: int, j: int) -> Optional[Tuple[np.ndarray, float, bool]]:
+    """Scalar `_circles` for the span points[i..j]: (center, radius, ccw), or None."""
+    ax, ay = points[i].tolist()
+    mx, my = points[(i + j) // 2].tolist()
+    bx, by = points[j].tolist()
+    cross = (mx - ax) * (by - my) - (my - ay) * (bx - mx)
+    if abs(cross) < 1e-12:
+        return None
+    a2, m2, b2 = ax * ax + ay * ay, mx * mx + my * my, bx * bx + by * by
+    den = 2.0 * (ax * (my - by) + mx * (by - ay) + bx * (ay - my))
+    cx = (a2 * (my - by) + m2 * (by - ay) + b2 * (ay - my)) / den
+    cy = (a2 * (bx - mx) + m2 * (ax - bx) + b2 * (mx - ax)) / den
+    radius = math.hypot(ax - cx, ay - cy)
+    if radius > MAX_RADIUS:
+        return None
+    return np.array([cx, cy]), radius, cross > 0
+
+
+def _arc_error(points: np.ndarray, i: int, j: int) -> float:
+    """Scalar `_arc_errors` for the span points[i..j], without the batch overhead."""
+    circle = _arc_through(points, i, j)
+    if circle is None:
+        return math.inf
+    center, radius, ccw = circle
+    rel = points[i:j + 1] - center
+    x, y = rel[:, 0], rel[:, 1]
+    radial = np.abs(np.hypot(x, y) - radius)
+    steps = np.arctan2(x[:-1] * y[1:] - y[:-1] * x[1:], x[:-1] * x[1:] + y[:-1] * y[1:])
+    if not ccw:
+        steps = -steps
+    if steps.min() <= 0 or steps.sum() >= 2 * math.pi - 1e-6:
+        return math.inf
+    sagitta = radius * (1.0 - np.cos(steps * 0.5))
+    return float((np.maximum(radial[:-1], radial[1:]) + sagitta).max())
+
+
+def _span_errors(error_fn, points: np.ndarray, k: int) -> np.ndarray:
+    """error_fn for every span of k segments (points[i] .. points[i + k]) at once; inf past the end."""
+    out = np.full(len(points), np.inf)
+    if len(points) > k:
+        windows = np.lib.stride_tricks.sliding_window_view(points, k + 1, axis=0).transpose(0, 2, 1)
+        out[: len(windows)] = error_fn(windows)
+    return out
+
+
+def _longest_fit(error_fn, points: np.ndarray, i: int, first: int, tolerance: float) -> int:
+    """Largest j >= first with error_fn(points, i, j) <= tolerance, or i if none.
+
+    Gallops (first, first+2, first+6, ...) then bisects, so each run costs
+    O(log n) vectorized checks rather than one check per point.
+    """
+    last = len(points) - 1
+    if first > last or error_fn(points, i, first) > tolerance:
+        return i
+    good, bad = first, None
+    step = 2
+    while bad is None:
+        j = min(good + step, last)
+        if j == good:
+            return good
+        if error_fn(points, i, j) <= tolerance:
+            good = j
+            step *= 2
+        else:
+            bad = j
+    while bad - good > 1:
+        mid = (good + bad) // 2
+        if error_fn(points, i, mid) <= tolerance:
+            good = mid
+        else:
+            bad = mid
+    return good
+
+
+def _rounding_error(*values: float) -> float:
+    """Distance an (x, y) pair moves when written with `_fmt`'s 3 decimals."""
+    return math.hypot(*(v - float(_fmt(v)) for v in values))
+
+
+def fit_polyline(points: np.ndarray, tolerance: float = DEFAULT_TOLERANCE) -> Tuple[List[tuple], float]:
+    """Replace a polyline (points[0] is the current position) with G01/G02/G03 moves.
+
+    Returns (moves, max deviation). Moves are ("G01", end, x, y) or
+    ("G02"/"G03", end, x, y, i, j), where `end` is the index of the point the
+    move ends on and I/J are relative to the move's start point. The deviation
+    includes the error from writing coordinates with 3 decimals.
+    """
+    points = np.asarray(points, dtype=float)
+    coords = points.tolist()
+    moves: List[tuple] = []
+    max_dev = 0.0
+    last = len(points) - 1
+    # Leave room for the 3-decimal rounding of the emitted coordinates
+    tolerance = max(tolerance - _ROUNDING, 0.0)
+    # Screen every start point at once with the first checks `_longest_fit` would
+    # make; where none pass (incompressible input) the move is a plain G01 and
+    # no per-point numpy calls are needed.
+    mergeable = (
+        (_span_errors(_line_errors, points, 2) <= tolerance)
+        | (_span_errors(_line_errors, points, 3) <= tolerance)
+        | (_span_errors(_arc_errors, points, MIN_ARC_SEGMENTS) <= tolerance)
+    )
+    i = 0
+    while i < last:
+        if not mergeable[i]:
+            moves.append(("G01", i + 1) + tuple(coords[i + 1]))
+            i += 1
+            continue
+        j_line = _longest_fit(_line_error, points, i, i + 1, tolerance)
+        j_arc = _longest_fit(_arc_error, points, i, i + MIN_ARC_SEGMENTS, tolerance)
+        if j_arc > j_line:
+            center, _, ccw = _arc_through(points, i, j_arc)  # type: ignore[misc]
+            offset = center - points[i]
+            x, y = coords[j_arc]
+            moves.append(("G03" if ccw else "G02", j_arc, x, y, offset[0], offset[1]))
+            dev = _arc_error(points, i, j_arc) + max(_rounding_error(x, y), _rounding_error(*offset))
+            max_dev = max(max_dev, dev)
+            i = j_arc
+        else:
+            # A zero-length step has no direction; keep it as-is
+            j_line = max(j_line, i + 1)
+            x, y = coords[j_line]
+            moves.append(("G01", j_line, x, y))
+            if j_line > i + 1:
+                max_dev = max(max_dev, _line_error(points, i, j_line) + _rounding_error(x, y))
+            i = j_line
+    return moves, max_dev
+
+
+def format_move(move: tuple) -> str:
+    if move[0] == "G01":
+        return f"G01 X{_fmt(move[2])} Y{_fmt(move[3])}"
+    return f"{move[0]} X{_fmt(move[2])} Y{_fmt(move[3])} I{_fmt(move[4])} J{_fmt(move[5])}"
+
+
+def compress_program(lines: List[str], tolerance: float = DEFAULT_TOLERANCE) -> Tuple[List[str], dict]:
+    """Fit runs of consecutive plain XY `G01` lines in a G-code program to arcs.
+
+    Only runs whose start position is known (absolute mode, numeric coordinates)
+    are touched; every other line is passed through unchanged, as are single
+    moves the fit leaves alone. Blank lines inside a run are dropped.
+    """
+    out: List[str] = []
+    pos: List[Optional[float]] = [None, None, None]
+    absolute = True
+    run: List[Tuple[float, float]] = []
+    run_lines: List[str] = []
+    run_start: Optional[Tuple[float, float]] = None
+    stats = {"moves_in": 0, "moves_out": 0, "max_deviation": 0.0}
+
+    def flush(next_line: str = "") -> None:
+        nonlocal run, run_lines, run_start
+        if run:
+            moves, dev = fit_polyline(np.array([run_start] + run), tolerance)
+            start = 0
+            for move in moves:
+                end = move[1]
+                # A move covering exactly one source line is kept verbatim
+                out.append(run_lines[end - 1] if move[0] == "G01" and end == start + 1 else format_move(move))
+                start = end
+            # Lines relying on modal G01 (e.g. "X0 Y-10") must not inherit an arc
+            if moves[-1][0] != "G01" and _MODAL_AXES.match(next_line):
+                out.append(format_move(("G01",) + moves[-1][1:4]))
+            stats["moves_in"] += len(run)
+            stats["moves_out"] += len(moves)
+            stats["max_deviation"] = max(stats["max_deviation"], dev)
+        run, run_lines, run_start = [], [], None
+
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        xy = _XY_MOVE.match(line)
+        if xy and absolute and pos[0] is not None and pos[1] is not None:
+            x, y = pos[0], pos[1]
+            for axis, value in _AXIS_WORD.findall(xy.group(1)):
+                if axis.upper() == "X":
+                    x = float(value)
+                else:
+                    y = float(value)
+            if not run:
+                run_start = (pos[0], pos[1])
+            run.append((x, y))
+            run_lines.append(line)
+            pos[0], pos[1] = x, y
+            continue
+        if not line.strip() and run:
+            continue
+        flush(line)
+        out.append(line)
+        # Track the modal state needed to know where the next run starts
+        code = line.split(";", 1)[0]
+        for mode in _MODE_WORD.findall(code):
+            absolute = mode == "90"
+        if _MOVE.match(code):
+            for axis, value in _AXIS_WORD.findall(code):
+                k = "XYZ".index(axis.upper())
+                pos[k] = float(value) if absolute and not value.startswith("[") else None
+        elif code.strip() and not _NO_MOTION.match(code):
+            # Arcs, homing, modal axis-only moves, subprogram calls, jumps, ...:
+            # the position can no longer be tracked exactly
+            pos = [None, None, None]
+    flush()
+
+    stats["lines_in"] = len(lines)
+    stats["lines_out"] = len(out)
+    stats["compression_ratio"] = stats["moves_in"] / stats["moves_out"] if stats["moves_out"] else 1.0
+    return out, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fit runs of G01 segments to G02/G03 arcs.")
+    parser.add_argument("input", help="G-code program (.dtgc / .gcode)")
+    parser.add_argument("-o", "--output", help="Write the compressed program here (default: print stats only)")
+    parser.add_argument("-t", "--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Max deviation in mm")
+    args = parser.parse_args()
+
+    with open(args.input, "r", encoding="utf-8", errors="ignore") as f:
+        lines = f.read().splitlines()
+    t0 = time.perf_counter()
+    out, stats = compress_program(lines, args.tolerance)
+    elapsed = time.perf_counter() - t0
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(out) + "\n")
+
+    print(f"Lines: {stats['lines_in']} -> {stats['lines_out']}")
+    print(f"Fitted G01 moves: {stats['moves_in']} -> {stats['moves_out']} (ratio {stats['compression_ratio']:.2f}x)")
+    print(f"Max deviation: {stats['max_deviation']:.4f} mm (tolerance {args.tolerance} mm)")
+    print(f"Time: {elapsed:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
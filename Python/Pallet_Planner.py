@@ -0,0 +1,244 @@
+import argparse
+import csv
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Defaults taken from "Detect Objects On Conveyor.dtgc"
+DEFAULT_FEED = 400.0  # mm/s (G01 F; Delta X firmware uses mm/s)
+DEFAULT_ACCEL = 5000.0  # mm/s^2 (M204 A)
+DEFAULT_SAFE_Z = -320.0
+DEFAULT_PICK_Z = -340.0
+DEFAULT_DROP_Z = -380.0
+# Pick region is sampled on an N x N grid to estimate the average pick position
+PICK_SAMPLES = 7
+
+
+# ---------- Layouts ----------
+def grid_layout(origin: Tuple[float, float], rows: int, cols: int, pitch: Tuple[float, float]) -> np.ndarray:
+    """Row-major grid of (x, y) drop points: rows step along X, columns along Y."""
+    r, c = np.meshgrid(np.arange(rows), np.arange(cols), indexing="ij")
+    xs = origin[0] + r.ravel() * pitch[0]
+    ys = origin[1] + c.ravel() * pitch[1]
+    return np.column_stack([xs, ys])
+
+
+def staggered_layout(origin: Tuple[float, float], rows: int, cols: int, pitch: Tuple[float, float]) -> np.ndarray:
+    """Like `grid_layout`, but every other row is shifted by half a column pitch."""
+    points = grid_layout(origin, rows, cols, pitch)
+    row_index = np.repeat(np.arange(rows), cols)
+    points[:, 1] += (row_index % 2) * pitch[1] / 2.0
+    return points
+
+
+def load_custom_layout(path: str) -> np.ndarray:
+    """Read drop points from a CSV file with `x,y` per line (header optional)."""
+    points = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            try:
+                points.append((float(row[0]), float(row[1])))
+            except (ValueError, IndexError):
+                continue
+    if not points:
+        raise ValueError(f"{path}: no x,y drop points found")
+    return np.array(points)
+
+
+def stack_layers(points: np.ndarray, layers: int, drop_z: float, layer_height: float) -> np.ndarray:
+    """Repeat an (x, y) layout per layer, returning (x, y, z) slots bottom layer first.
+
+    Layers stack upwards, so `layer_height` must be positive when `layers` > 1.
+    """
+    if layers > 1 and layer_height <= 0:
+        raise ValueError("layer_height must be positive when stacking more than one layer")
+    slots = [np.column_stack([points, np.full(len(points), drop_z + k * layer_height)]) for k in range(layers)]
+    return np.vstack(slots)
+
+
+# ---------- Motion time model ----------
+def move_time(distance: np.ndarray, feed: float, accel: float) -> np.ndarray:
+    """Time (s) of straight G01 moves with a trapezoidal speed profile.
+
+    `feed` is in mm/s like the Delta X G01 F word, `accel` in mm/s^2 like M204 A.
+    Short moves never reach `feed` and follow a triangular profile instead.
+    The estimate covers motion only; dwells (G04) and vision waits are not included.
+    """
+    v = feed
+    d = np.asarray(distance, dtype=float)
+    ramp = v * v / accel  # distance spent accelerating plus decelerating
+    return np.where(d >= ramp, d / v + v / accel, 2.0 * np.sqrt(d / accel))
+
+
+def slot_cycle_times(
+    slots: np.ndarray,
+    pick_region: Tuple[float, float, float, float],
+    feed: float = DEFAULT_FEED,
+    accel: float = DEFAULT_ACCEL,
+    safe_z: float = DEFAULT_SAFE_Z,
+    pick_z: float = DEFAULT_PICK_Z,
+) -> np.ndarray:
+    """Expected pick -> drop -> pick time for every slot.
+
+    Mirrors the conveyor programs: lift to `safe_z`, move over the slot, lower to
+    the slot's Z, lift again, return over a pick point and lower to `pick_z`. The
+    pick point is averaged over a grid covering `pick_region` (x0, y0, x1, y1).
+    """
+    x0, y0, x1, y1 = pick_region
+    gx, gy = np.meshgrid(np.linspace(x0, x1, PICK_SAMPLES), np.linspace(y0, y1, PICK_SAMPLES))
+    picks = np.column_stack([gx.ravel(), gy.ravel()])
+    # (slots, picks) horizontal distances, all at once
+    dist = np.linalg.norm(slots[:, None, :2] - picks[None, :, :], axis=2)
+    travel = 2.0 * move_time(dist, feed, accel).mean(axis=1)
+    vertical = 2.0 * move_time(np.abs(safe_z - pick_z), feed, accel) + 2.0 * move_time(
+        np.abs(safe_z - slots[:, 2]), feed, accel
+    )
+    return travel + vertical
+
+
+# ---------- Planning ----------
+def plan_order(slots: np.ndarray, cycle_times: np.ndarray, count: Optional[int] = None) -> np.ndarray:
+    """Fill order: layer by layer (lowest Z first), cheapest slots first within a layer.
+
+    With a fixed pick region each slot costs the same whenever it is filled, so
+    a full pallet takes the same total time in any order. The order only saves
+    time when `count` is below the slot count: the cheapest slots are used.
+    """
+    order = np.lexsort((cycle_times, slots[:, 2]))
+    return order if count is None else order[:count]
+
+
+def compare_orders(cycle_times: np.ndarray, fixed: np.ndarray, optimized: np.ndarray) -> dict:
+    fixed_total = float(cycle_times[fixed].sum())
+    optimized_total = float(cycle_times[optimized].sum())
+    return {
+        "parts": len(optimized),
+        "fixed_total": fixed_total,
+        "optimized_total": optimized_total,
+        "saved": fixed_total - optimized_total,
+    }
+
+
+# ---------- Output ----------
+def _fmt(value: float) -> str:
+    text = ("%0.3f" % value).rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def drop_gcode(slot: Sequence[float], safe_z: float = DEFAULT_SAFE_Z) -> List[str]:
+    """G-code lines for one drop, ready for `SerialManager.send_line` or `send_gcode`."""
+    x, y, z = slot
+    return [
+        f"G01 Z{_fmt(safe_z)}",
+        f"G01 X{_fmt(x)} Y{_fmt(y)}",
+        f"G01 Z{_fmt(z)}",
+        "M05",
+        f"G01 Z{_fmt(safe_z)}",
+    ]
+
+
+def drop_subprogram(slots: np.ndarray, order: np.ndarray, number: int = 5000) -> List[str]:
+    """GScript subprogram setting #XOrder, #YOrder, #ZOrder from #Counter.
+
+    Replaces the `#XOrder = 80 + [#Counter / 4] * 30` style arithmetic: set
+    #Counter to 1 for the first part, call `M98 P<number>`, then move to
+    X[#XOrder] Y[#YOrder] Z[#ZOrder]. A #Counter outside 1..parts (pallet full)
+    never returns: the program waits there instead of dropping onto a used slot.
+    """
+    n = number
+    lines = [
+        f";Drop positions from Pallet_Planner.py: {len(order)} parts, #Counter = 1 for the first part",
+        f"N{n} O{n}",
+    ]
+    branch_n = n + 5
+    body_n = n + 5 * (len(order) + 2)
+    end_n = body_n + 20 * len(order)
+    full_n = end_n + 5
+    bodies = []
+    for k, slot_index in enumerate(order, start=1):
+        x, y, z = slots[slot_index]
+        lines.append(f"N{branch_n} IF [#Counter == {k}] THEN GOTO {body_n}")
+        bodies += [
+            f"N{body_n} #XOrder = {_fmt(x)}",
+            f"N{body_n + 5} #YOrder = {_fmt(y)}",
+            f"N{body_n + 10} #ZOrder = {_fmt(z)}",
+            f"N{body_n + 15} GOTO {end_n}",
+        ]
+        branch_n += 5
+        body_n += 20
+    lines.append(f"N{branch_n} GOTO {full_n}")
+    lines += bodies
+    lines += [
+        f"N{end_n} M99",
+        ";Pallet full: wait here until the program is restarted with an empty pallet",
+        f"N{full_n} G04 P1000",
+        f"N{full_n + 5} GOTO {full_n}",
+    ]
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Plan pallet drop positions and fill order for pick & place.")
+    parser.add_argument("layout", choices=("grid", "staggered", "custom"))
+    parser.add_argument("--origin", type=float, nargs=2, default=(80.0, 0.0), metavar=("X", "Y"))
+    parser.add_argument("--rows", type=int, default=4)
+    parser.add_argument("--cols", type=int, default=4)
+    parser.add_argument("--pitch", type=float, nargs=2, default=(30.0, 30.0), metavar=("DX", "DY"))
+    parser.add_argument("--points", help="CSV file with x,y drop points (custom layout)")
+    parser.add_argument("--layers", type=int, default=1)
+    parser.add_argument("--layer-height", type=float, default=0.0, help="Z step per layer (mm)")
+    parser.add_argument("--pick-region", type=float, nargs=4, required=True, metavar=("X0", "Y0", "X1", "Y1"))
+    parser.add_argument("--pick-z", type=float, default=DEFAULT_PICK_Z)
+    parser.add_argument("--drop-z", type=float, default=DEFAULT_DROP_Z)
+    parser.add_argument("--safe-z", type=float, default=DEFAULT_SAFE_Z)
+    parser.add_argument("--feed", type=float, default=DEFAULT_FEED, help="G01 F (mm/s)")
+    parser.add_argument("--accel", type=float, default=DEFAULT_ACCEL, help="M204 A (mm/s^2)")
+    parser.add_argument("--count", type=int, help="Parts per pallet (default: every slot)")
+    parser.add_argument("--number", type=int, default=5000, help="Subprogram number / first N line")
+    parser.add_argument("-o", "--output", help="Write the GScript drop subprogram here")
+    args = parser.parse_args()
+
+    if args.layout == "custom":
+        if not args.points:
+            parser.error("custom layout needs --points")
+        points = load_custom_layout(args.points)
+    elif args.layout == "staggered":
+        points = staggered_layout(args.origin, args.rows, args.cols, args.pitch)
+    else:
+        points = grid_layout(args.origin, args.rows, args.cols, args.pitch)
+    if args.layers > 1 and args.layer_height <= 0:
+        parser.error("--layers > 1 needs a positive --layer-height")
+    slots = stack_layers(points, args.layers, args.drop_z, args.layer_height)
+    if args.count is not None and args.count < 1:
+        parser.error("--count must be at least 1")
+    count = len(slots) if args.count is None else min(args.count, len(slots))
+
+    cycle_times = slot_cycle_times(slots, args.pick_region, args.feed, args.accel, args.safe_z, args.pick_z)
+    order = plan_order(slots, cycle_times, count)
+    report = compare_orders(cycle_times, np.arange(count), order)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\n".join(drop_subprogram(slots, order, args.number)) + "\n")
+
+    print(f"Slots: {len(slots)}  Parts: {report['parts']}")
+    print(
+        f"Estimated motion time: {report['optimized_total']:.2f} s per pallet, "
+        f"{report['optimized_total'] / count:.2f} s per part"
+    )
+    if count < len(slots):
+        print(
+            f"First {count} slots in pattern order: {report['fixed_total']:.2f} s; "
+            f"cheapest {count} slots: {report['optimized_total']:.2f} s "
+            f"(saving {report['saved']:.2f} s per pallet)"
+        )
+    else:
+        print("Full pallet with a fixed pick region: fill order does not change the total time.")
+    print("Fill order (x, y, z):")
+    for slot_index in order:
+        print("  " + ", ".join(_fmt(v) for v in slots[slot_index]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
+import queue
 import sys
 import threading
 import time
-from typing import List, Optional, Tuple
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Tuple
 
 import serial
 from serial.tools import list_ports
 
-from PyQt5.QtCore import Qt, QObject, pyqtSignal
+from Session_Recorder import RECEIVED, SENT, SessionRecorder
+
+from PyQt5.QtCore import Qt, QObject, QTimer, pyqtSignal
 from PyQt5.QtWidgets import (
     QApplication,
     QComboBox,
@@ -26,6 +30,76 @@ from PyQt5.QtWidgets import (
 
 
 DEFAULT_BAUD = 115200
+# Event-loop delays longer than this are counted as GUI stalls
+STALL_THRESHOLD_MS = 100.0
+
+
+class SerialFuture(Future):
+    """Future for a serial task that can also be cancelled while it is running.
+
+    `cancel()` on a plain Future only works before the task starts. Here it also
+    sets `cancel_event`, which long tasks (e.g. Auto-Scan) poll between steps.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.cancel_event = threading.Event()
+
+    def cancel(self) -> bool:
+        self.cancel_event.set()
+        return super().cancel()
+
+
+class SerialExecutor:
+    """Runs blocking serial work on one worker thread, in submission order.
+
+    A single thread keeps commands in the order they were sent and means only
+    this thread ever opens, writes to or closes the port.
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Optional[Tuple[SerialFuture, Callable[..., Any], tuple]]]" = queue.Queue()
+        self._pending: List[SerialFuture] = []
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="SerialExecutor", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> SerialFuture:
+        """Queue `fn(cancel_event, *args)` and return its future immediately."""
+        future = SerialFuture()
+        with self._pending_lock:
+            self._pending.append(future)
+        self._queue.put((future, fn, args))
+        return future
+
+    def cancel_all(self) -> None:
+        with self._pending_lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        self._queue.put(None)
+        self._thread.join(timeout=timeout)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, fn, args = item
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(future.cancel_event, *args)
+                except BaseException as exc:
+                    future.set_exception(exc)
+                else:
+                    future.set_result(result)
+            finally:
+                with self._pending_lock:
+                    self._pending.remove(future)
 
 
 class SerialManager(QObject):
@@ -35,25 +109,47 @@ class SerialManager(QObject):
     lineReceived = pyqtSignal(str)
     lineSent = pyqtSignal(str)
     portsRefreshed = pyqtSignal(list)
+    # message, done, total (total == 0 means indeterminate)
+    progress = pyqtSignal(str, int, int)
+    scanFinished = pyqtSignal(bool)
+    openFailed = pyqtSignal(str)
 
     def __init__(self) -> None:
         super().__init__()
         self._serial: Optional[serial.Serial] = None
         self._reader_thread: Optional[threading.Thread] = None
-        self._reader_running: bool = False
+        self._reader_stop: Optional[threading.Event] = None
         self._lock = threading.Lock()
+        self._recorder: Optional[SessionRecorder] = None
+        # All blocking port work below runs here, never on the GUI thread
+        self._executor = SerialExecutor()
 
     # ---------- Discovery ----------
-    def refresh_ports(self) -> None:
+    def refresh_ports(self) -> SerialFuture:
+        return self._executor.submit(self._refresh_ports)
+
+    def autoscan_and_connect(self, baud: int = DEFAULT_BAUD) -> SerialFuture:
+        """Start an Auto-Scan; cancel the returned future to stop between ports."""
+        return self._executor.submit(self._autoscan_and_connect, baud)
+
+    def _refresh_ports(self, cancel: threading.Event) -> List[str]:
         ports = [p.device for p in list_ports.comports()]
         self.portsRefreshed.emit(ports)
-
-    def autoscan_and_connect(self, baud: int = DEFAULT_BAUD) -> bool:
-        for port_info in list_ports.comports():
+        return ports
+
+    def _autoscan_and_connect(self, cancel: threading.Event, baud: int) -> bool:
+        port_infos = list(list_ports.comports())
+        total = len(port_infos)
+        for index, port_info in enumerate(port_infos):
+            if cancel.is_set():
+                self.progress.emit("Auto-Scan đã hủy.", index, total)
+                self.scanFinished.emit(False)
+                return False
             port_name = port_info.device
+            self.progress.emit(f"Auto-Scan: {port_name}", index, total)
             try:
                 trial = serial.Serial(port_name, baud, timeout=1)
-                time.sleep(0.3)
+                cancel.wait(0.3)
                 try:
                     trial.reset_input_buffer()
                 except Exception:
@@ -62,89 +158,152 @@ class SerialManager(QObject):
                 reply = trial.readline().decode("utf-8", errors="ignore").strip()
                 if "YesDelta" in reply:
                     trial.close()
-                    return self.open_port(port_name, baud)
+                    self.progress.emit(f"Auto-Scan: tìm thấy {port_name}", total, total)
+                    ok = self._open_port(cancel, port_name, baud)
+                    self.scanFinished.emit(ok)
+                    return ok
                 trial.close()
             except Exception:
                 # Ignore ports that cannot be opened/read
                 continue
+        self.progress.emit("Auto-Scan xong.", total, total)
         self.error.emit("Không tìm thấy robot Delta X qua Auto-Scan.")
+        self.scanFinished.emit(False)
         return False
 
     # ---------- Connection ----------
-    def open_port(self, port_name: str, baud: int = DEFAULT_BAUD) -> bool:
-        self.close_port()
+    def open_port(self, port_name: str, baud: int = DEFAULT_BAUD) -> SerialFuture:
+        return self._executor.submit(self._open_port, port_name, baud)
+
+    def close_port(self) -> SerialFuture:
+        return self._executor.submit(self._close_port)
+
+    def shutdown(self, timeout: float = 2.0) -> None:
+        """Cancel queued work, close the port and stop the worker thread."""
+        self._executor.cancel_all()
+        try:
+            self.close_port().result(timeout=timeout)
+        except Exception:
+            pass
+        self._executor.shutdown(timeout)
+
+    def _open_port(self, cancel: threading.Event, port_name: str, baud: int) -> bool:
+        self._close_port(cancel)
+        self.progress.emit(f"Đang mở {port_name}…", 0, 0)
         try:
-            self._serial = serial.Serial(port_name, baud, timeout=1)
+            ser = serial.Serial(port_name, baud, timeout=1)
             # Give the device a moment to reset (common on Arduino-like boards)
             time.sleep(0.3)
-            self._start_reader()
+            with self._lock:
+                self._serial = ser
+            self._start_reader(ser)
             self.connected.emit(port_name)
             return True
         except Exception as exc:
-            self._serial = None
+            with self._lock:
+                self._serial = None
             self.error.emit(f"Không thể mở cổng {port_name}: {exc}")
+            self.openFailed.emit(port_name)
             return False
 
-    def close_port(self) -> None:
+    def _close_port(self, cancel: Optional[threading.Event] = None) -> None:
         with self._lock:
-            if self._serial is None:
-                return
+            ser = self._serial
+            self._serial = None
+        if ser is None:
+            return
+        # Close first so a reader blocked in readline() fails out right away
+        try:
+            ser.close()
+        except Exception:
+            pass
+        finally:
             self._stop_reader()
+            self.disconnected.emit()
+
+    # ---------- Recording ----------
+    def start_recording(self, path: str) -> None:
+        """Record every sent/received line to a binary session log at `path`."""
+        self.stop_recording()
+        self._recorder = SessionRecorder(path)
+
+    def stop_recording(self) -> None:
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+
+    def is_recording(self) -> bool:
+        return self._recorder is not None
+
+    def _record(self, direction: int, line: str) -> None:
+        # A recorder failure must never drop serial traffic; stop recording instead
+        recorder = self._recorder
+        if recorder is None:
+            return
+        try:
+            recorder.record(direction, line)
+        except Exception as exc:
+            self._recorder = None
             try:
-                self._serial.close()
+                recorder.close()
             except Exception:
                 pass
-            finally:
-                self._serial = None
-                self.disconnected.emit()
+            self.error.emit(f"Lỗi ghi phiên, đã dừng ghi: {exc}")
 
     # ---------- IO ----------
-    def send_line(self, command: str) -> None:
-        with self._lock:
-            if self._serial is None:
-                self.error.emit("Chưa kết nối cổng COM.")
-                return
-            try:
-                normalized = command.strip()
-                data = (normalized.rstrip("\r\n") + "\n").encode("utf-8")
-                self._serial.write(data)
-                self.lineSent.emit(normalized)
-            except Exception as exc:
-                self.error.emit(f"Lỗi gửi lệnh: {exc}")
-
-    def _start_reader(self) -> None:
-        if self._reader_running:
-            return
-        self._reader_running = True
+    def send_line(self, command: str) -> SerialFuture:
+        return self._executor.submit(self._send_line, command)
+
+    def _send_line(self, cancel: threading.Event, command: str) -> bool:
+        # Only the executor thread opens/closes the port, so no lock is needed
+        # around the write; the reader keeps reading concurrently.
+        ser = self._serial
+        if ser is None:
+            self.error.emit("Chưa kết nối cổng COM.")
+            return False
+        try:
+            normalized = command.strip()
+            data = (normalized.rstrip("\r\n") + "\n").encode("utf-8")
+            ser.write(data)
+            self._record(SENT, normalized)
+            self.lineSent.emit(normalized)
+            return True
+        except Exception as exc:
+            self.error.emit(f"Lỗi gửi lệnh: {exc}")
+            return False
+
+    def _start_reader(self, ser: serial.Serial) -> None:
+        # Each reader owns its port reference and stop event, so a reader that
+        # outlives its port can never pick up the next connection
+        self._stop_reader()
+        stop = threading.Event()
+        self._reader_stop = stop
 
         def _read_loop() -> None:
-            while self._reader_running:
-                ser_ref: Optional[serial.Serial]
-                with self._lock:
-                    ser_ref = self._serial
-                if ser_ref is None:
-                    break
+            while not stop.is_set():
                 try:
-                    line = ser_ref.readline()
+                    line = ser.readline()
                     if not line:
                         continue
                     decoded = line.decode("utf-8", errors="ignore").rstrip("\r\n")
-                    if decoded:
+                    if decoded and not stop.is_set():
+                        self._record(RECEIVED, decoded)
                         self.lineReceived.emit(decoded)
                 except Exception:
                     # Short sleep to avoid tight error loops
-                    time.sleep(0.05)
+                    stop.wait(0.05)
 
         self._reader_thread = threading.Thread(target=_read_loop, daemon=True)
         self._reader_thread.start()
 
     def _stop_reader(self) -> None:
-        if not self._reader_running:
-            return
-        self._reader_running = False
+        if self._reader_stop is not None:
+            self._reader_stop.set()
+            self._reader_stop = None
         if self._reader_thread is not None:
             try:
-                self._reader_thread.join(timeout=0.5)
+                # Longer than the 1 s port read timeout
+                self._reader_thread.join(timeout=2.0)
             except Exception:
                 pass
             self._reader_thread = None
@@ -423,6 +582,52 @@ class JoggingTab(QWidget):
                 pass
 
 
+class StallMonitor(QObject):
+    """Measures how late the GUI event loop services a short repeating timer.
+
+    Any lateness beyond the timer interval is time the GUI thread spent blocked.
+    """
+
+    stallDetected = pyqtSignal(float)
+
+    def __init__(self, interval_ms: int = 20, threshold_ms: float = STALL_THRESHOLD_MS, parent: Optional[QObject] = None) -> None:
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.max_stall_ms = 0.0
+        self.stall_count = 0
+        self.total_stall_ms = 0.0
+        self._last_tick = time.monotonic()
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._on_tick)
+
+    def start(self) -> None:
+        self._last_tick = time.monotonic()
+        self._timer.start()
+
+    def stop(self) -> None:
+        self._timer.stop()
+
+    def _on_tick(self) -> None:
+        now = time.monotonic()
+        late_ms = (now - self._last_tick) * 1000.0 - self.interval_ms
+        self._last_tick = now
+        if late_ms > self.max_stall_ms:
+            self.max_stall_ms = late_ms
+        if late_ms >= self.threshold_ms:
+            self.stall_count += 1
+            self.total_stall_ms += late_ms
+            self.stallDetected.emit(late_ms)
+
+    def summary(self) -> str:
+        return (
+            f"GUI stalls >= {self.threshold_ms:.0f} ms: {self.stall_count}, "
+            f"max {self.max_stall_ms:.0f} ms, total {self.total_stall_ms:.0f} ms"
+        )
+
+
 class MainWindow(QMainWindow):
     def __init__(self) -> None:
         super().__init__()
@@ -430,11 +635,14 @@ class MainWindow(QMainWindow):
         self.resize(900, 600)
 
         self.serial_manager = SerialManager()
+        self.stall_monitor = StallMonitor(parent=self)
+        self._scan_future: Optional[SerialFuture] = None
         self._build_ui()
         self._connect_signals()
 
         # Initial ports refresh
         self.serial_manager.refresh_ports()
+        self.stall_monitor.start()
 
     def _build_ui(self) -> None:
         central = QWidget(self)
@@ -454,6 +662,8 @@ class MainWindow(QMainWindow):
         self.disconnect_btn = QPushButton("Disconnect", self)
         self.disconnect_btn.setEnabled(False)
         self.autoscan_btn = QPushButton("Auto-Scan", self)
+        self.record_btn = QPushButton("Record", self)
+        self.record_btn.setCheckable(True)
 
         conn_layout.addWidget(QLabel("Port:", self))
         conn_layout.addWidget(self.ports_combo, 1)
@@ -463,6 +673,7 @@ class MainWindow(QMainWindow):
         conn_layout.addWidget(self.connect_btn)
         conn_layout.addWidget(self.disconnect_btn)
         conn_layout.addWidget(self.autoscan_btn)
+        conn_layout.addWidget(self.record_btn)
 
         outer.addWidget(conn_group)
 
@@ -474,16 +685,26 @@ class MainWindow(QMainWindow):
         self.tabs.addTab(self.terminal_tab, "Terminal")
         outer.addWidget(self.tabs, 1)
 
+        # Status bar: serial progress on the left, GUI stall stats on the right
+        self.stall_label = QLabel(self.stall_monitor.summary(), self)
+        self.statusBar().addPermanentWidget(self.stall_label)
+
     def _connect_signals(self) -> None:
         self.refresh_ports_btn.clicked.connect(self.serial_manager.refresh_ports)
         self.autoscan_btn.clicked.connect(self._on_autoscan)
         self.connect_btn.clicked.connect(self._on_connect)
         self.disconnect_btn.clicked.connect(self._on_disconnect)
+        self.record_btn.toggled.connect(self._on_record_toggled)
 
         self.serial_manager.portsRefreshed.connect(self._on_ports_refreshed)
         self.serial_manager.connected.connect(self._on_connected)
         self.serial_manager.disconnected.connect(self._on_disconnected)
         self.serial_manager.error.connect(self._on_error)
+        self.serial_manager.progress.connect(self._on_progress)
+        self.serial_manager.scanFinished.connect(self._on_scan_finished)
+        self.serial_manager.openFailed.connect(self._on_open_failed)
+
+        self.stall_monitor.stallDetected.connect(self._on_stall)
 
     # ---------- Connection handlers ----------
     def _on_ports_refreshed(self, ports: List[str]) -> None:
@@ -497,8 +718,27 @@ class MainWindow(QMainWindow):
         self.ports_combo.blockSignals(False)
 
     def _on_autoscan(self) -> None:
+        # The same button cancels a scan that is still running
+        if self._scan_future is not None and not self._scan_future.done():
+            if self._scan_future.cancel():
+                # Never started, so the worker will not report scanFinished
+                self._on_scan_finished(False)
+            return
         baud = int(self.baud_combo.currentText())
-        self.serial_manager.autoscan_and_connect(baud)
+        self._scan_future = self.serial_manager.autoscan_and_connect(baud)
+        self.autoscan_btn.setText("Cancel Scan")
+        self.connect_btn.setEnabled(False)
+
+    def _on_scan_finished(self, found: bool) -> None:
+        self._scan_future = None
+        self.autoscan_btn.setText("Auto-Scan")
+        if not found:
+            self.connect_btn.setEnabled(True)
+
+    def _on_progress(self, message: str, done: int, total: int) -> None:
+        if total > 0:
+            message = f"{message} ({done}/{total})"
+        self.statusBar().showMessage(message, 5000)
 
     def _on_connect(self) -> None:
         port = self.ports_combo.currentText()
@@ -506,11 +746,28 @@ class MainWindow(QMainWindow):
             self._on_error("Không có cổng nào được chọn.")
             return
         baud = int(self.baud_combo.currentText())
+        self.connect_btn.setEnabled(False)
         self.serial_manager.open_port(port, baud)
 
+    def _on_open_failed(self, port: str) -> None:
+        self.connect_btn.setEnabled(True)
+
     def _on_disconnect(self) -> None:
         self.serial_manager.close_port()
 
+    def _on_record_toggled(self, checked: bool) -> None:
+        if not checked:
+            self.serial_manager.stop_recording()
+            return
+        path = time.strftime("session_%Y%m%d_%H%M%S.dxlog")
+        try:
+            self.serial_manager.start_recording(path)
+        except OSError as exc:
+            self._on_error(f"Không thể ghi phiên: {exc}")
+            self.record_btn.setChecked(False)
+            return
+        self.terminal_tab._append_line(f"[Recording] {path}")
+
     def _on_connected(self, port: str) -> None:
         self.connect_btn.setEnabled(False)
         self.disconnect_btn.setEnabled(True)
@@ -533,12 +790,17 @@ class MainWindow(QMainWindow):
         # Also echo errors to terminal tab log for visibility
         self.terminal_tab._append_line(f"[Error] {message}")
 
+    def _on_stall(self, stall_ms: float) -> None:
+        self.stall_label.setText(self.stall_monitor.summary())
+
     # ---------- Window lifecycle ----------
     def closeEvent(self, event) -> None:  # type: ignore[override]
+        self.stall_monitor.stop()
         try:
-            self.serial_manager.close_port()
+            self.serial_manager.shutdown()
         except Exception:
             pass
+        self.serial_manager.stop_recording()
         super().closeEvent(event)
 
 
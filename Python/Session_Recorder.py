@@ -0,0 +1,434 @@
+import argparse
+import bisect
+import struct
+import threading
+import time
+import zlib
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+
+# ---------- File format ----------
+#
+# header   : "DXSL" u8 version, u8 reserved[3], u64 unix_ns (wall clock at start)
+# block    : "BK" u16 reserved, u32 payload_len, u32 count, u64 first_ns, u64 last_ns, u32 crc32, payload
+# payload  : per record: u8 direction, varint delta_us (from previous record), varint len, utf-8 bytes
+# index    : "IX" u16 reserved, u32 count, count * (u64 first_ns, u64 offset)
+# trailer  : u64 index_offset, "DXIX"
+#
+# All integers are little-endian, times are nanoseconds since the session start
+# (monotonic clock). Blocks are self-describing, so a file that was never closed
+# (crash, power loss) is still readable by scanning blocks; the index only makes
+# opening and seeking fast.
+
+MAGIC = b"DXSL"
+VERSION = 1
+HEADER = struct.Struct("<4sB3xQ")
+BLOCK_HEADER = struct.Struct("<2s2xIIQQI")
+INDEX_HEADER = struct.Struct("<2s2xI")
+INDEX_ENTRY = struct.Struct("<QQ")
+TRAILER = struct.Struct("<Q4s")
+
+SENT = 0
+RECEIVED = 1
+
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+
+def _encode_varint(value: int, out: bytearray) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class SessionRecorder:
+    """Append-only binary recorder for sent/received serial lines.
+
+    `record()` only encodes into an in-memory block; the file is written once per
+    block (`block_size` bytes or `flush_interval` seconds), so the cost per line
+    is a lock and a few bytes of encoding. Safe to call from several threads.
+    """
+
+    def __init__(self, path: str, block_size: int = DEFAULT_BLOCK_SIZE, flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.block_size = block_size
+        self.flush_interval = flush_interval
+        self._file: Optional[BinaryIO] = open(path, "wb")
+        self._lock = threading.Lock()
+        self._start_ns = time.monotonic_ns()
+        self._file.write(HEADER.pack(MAGIC, VERSION, time.time_ns()))
+        self._index: List[Tuple[int, int]] = []
+        self._payload = bytearray()
+        self._count = 0
+        self._first_ns = 0
+        self._last_ns = 0
+        self._last_flush = time.monotonic()
+        # Set when the background flush fails; the next record() raises it
+        self._error: Optional[OSError] = None
+        # Writes out a partly filled block after `flush_interval` of idle time,
+        # so buffered records are not held in memory until the next line arrives
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="SessionRecorder", daemon=True)
+        self._flusher.start()
+
+    def record(self, direction: int, line: str) -> None:
+        data = line.encode("utf-8")
+        record = bytearray()
+        with self._lock:
+            if self._file is None:
+                return
+            if self._error is not None:
+                raise self._error
+            # Read the clock under the lock so records from the reader and
+            # writer threads stay in time order within a block
+            now_ns = max(time.monotonic_ns() - self._start_ns, self._last_ns)
+            if self._count == 0:
+                self._first_ns = now_ns
+                self._last_ns = now_ns
+            delta_us = (now_ns - self._last_ns) // 1000
+            record.append(direction)
+            _encode_varint(delta_us, record)
+            _encode_varint(len(data), record)
+            record += data
+            self._payload += record
+            # Keep the rounding error from accumulating across records
+            self._last_ns += delta_us * 1000
+            self._count += 1
+            if len(self._payload) >= self.block_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_block()
+
+    def record_sent(self, line: str) -> None:
+        self.record(SENT, line)
+
+    def record_received(self, line: str) -> None:
+        self.record(RECEIVED, line)
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._flush_block()
+
+    def close(self) -> None:
+        self._closed.set()
+        with self._lock:
+            if self._file is None:
+                return
+            try:
+                self._flush_block()
+                index_offset = self._file.tell()
+                self._file.write(INDEX_HEADER.pack(b"IX", len(self._index)))
+                for first_ns, offset in self._index:
+                    self._file.write(INDEX_ENTRY.pack(first_ns, offset))
+                self._file.write(TRAILER.pack(index_offset, b"DXIX"))
+            finally:
+                # Release the handle even if the final writes fail
+                self._file.close()
+                self._file = None
+
+    def _flush_loop(self) -> None:
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._file is None or self._error is not None:
+                    continue
+                if time.monotonic() - self._last_flush >= self.flush_interval:
+                    try:
+                        self._flush_block()
+                    except OSError as exc:
+                        self._error = exc
+
+    def _flush_block(self) -> None:
+        # Caller holds self._lock
+        self._last_flush = time.monotonic()
+        if self._count == 0 or self._file is None:
+            return
+        payload = bytes(self._payload)
+        offset = self._file.tell()
+        self._file.write(
+            BLOCK_HEADER.pack(b"BK", len(payload), self._count, self._first_ns, self._last_ns, zlib.crc32(payload))
+        )
+        self._file.write(payload)
+        self._file.flush()
+        self._index.append((self._first_ns, offset))
+        self._payload = bytearray()
+        self._count = 0
+
+    def __enter__(self) -> "SessionRecorder":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class SessionLog:
+    """Reads a session written by `SessionRecorder`.
+
+    Uses the trailing index when present; otherwise (unclosed file) rebuilds it
+    by walking block headers, stopping at the first truncated or corrupt block.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file: BinaryIO = open(path, "rb")
+        magic, version, self.start_unix_ns = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a Delta X session log")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported session log version {version}")
+        self._index = self._read_index() or self._scan_index()
+        self._index_times = [first_ns for first_ns, _ in self._index]
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "SessionLog":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def block_count(self) -> int:
+        return len(self._index)
+
+    def duration(self) -> float:
+        if not self._index:
+            return 0.0
+        header = self._read_block_header(self._index[-1][1])
+        return header[4] / 1e9 if header else 0.0
+
+    def records(self, start: float = 0.0, end: Optional[float] = None) -> Iterator[Tuple[float, int, str]]:
+        """Yield (seconds since session start, direction, line) from `start` onwards."""
+        start_ns = int(start * 1e9)
+        end_ns = None if end is None else int(end * 1e9)
+        # Last block that starts at or before `start`; earlier blocks are skipped
+        first = max(bisect.bisect_right(self._index_times, start_ns) - 1, 0)
+        for _, offset in self._index[first:]:
+            block = self._read_block(offset)
+            if block is None:
+                return
+            for t_ns, direction, line in block:
+                if t_ns < start_ns:
+                    continue
+                if end_ns is not None and t_ns > end_ns:
+                    return
+                yield t_ns / 1e9, direction, line
+
+    def _read_index(self) -> Optional[List[Tuple[int, int]]]:
+        self._file.seek(0, 2)
+        size = self._file.tell()
+        if size < HEADER.size + TRAILER.size:
+            return None
+        self._file.seek(size - TRAILER.size)
+        index_offset, tag = TRAILER.unpack(self._file.read(TRAILER.size))
+        if tag != b"DXIX" or index_offset >= size:
+            return None
+        self._file.seek(index_offset)
+        tag, count = INDEX_HEADER.unpack(self._file.read(INDEX_HEADER.size))
+        if tag != b"IX":
+            return None
+        raw = self._file.read(count * INDEX_ENTRY.size)
+        return [INDEX_ENTRY.unpack_from(raw, i * INDEX_ENTRY.size) for i in range(count)]
+
+    def _scan_index(self) -> List[Tuple[int, int]]:
+        index: List[Tuple[int, int]] = []
+        offset = HEADER.size
+        while True:
+            header = self._read_block_header(offset)
+            if header is None:
+                break
+            payload_len, first_ns = header[1], header[3]
+            index.append((first_ns, offset))
+            offset += BLOCK_HEADER.size + payload_len
+        return index
+
+    def _read_block_header(self, offset: int) -> Optional[tuple]:
+        self._file.seek(offset)
+        raw = self._file.read(BLOCK_HEADER.size)
+        if len(raw) < BLOCK_HEADER.size:
+            return None
+        header = BLOCK_HEADER.unpack(raw)
+        if header[0] != b"BK":
+            return None
+        return header
+
+    def _read_block(self, offset: int) -> Optional[List[Tuple[int, int, str]]]:
+        header = self._read_block_header(offset)
+        if header is None:
+            return None
+        _, payload_len, count, first_ns, _, crc = header
+        payload = self._file.read(payload_len)
+        if len(payload) < payload_len or zlib.crc32(payload) != crc:
+            return None
+        records = []
+        pos = 0
+        t_ns = first_ns
+        for _ in range(count):
+            direction = payload[pos]
+            delta_us, pos = _decode_varint(payload, pos + 1)
+            length, pos = _decode_varint(payload, pos)
+            t_ns += delta_us * 1000
+            records.append((t_ns, direction, payload[pos:pos + length].decode("utf-8", errors="replace")))
+            pos += length
+        return records
+
+
+class EmulatedRobot:
+    """Minimal in-process stand-in for a Delta X controller.
+
+    Answers `IsDelta`, `Position` and tracks X/Y/Z from G0/G1/G28 so a recorded
+    session can be replayed without hardware. Everything else replies `Ok`.
+    """
+
+    HOME = (0.0, 0.0, -291.28)
+
+    def __init__(self) -> None:
+        self.x, self.y, self.z = self.HOME
+
+    def handle(self, line: str) -> str:
+        text = line.strip()
+        upper = text.upper()
+        if upper == "ISDELTA":
+            return "YesDelta"
+        if upper == "POSITION":
+            return f"{self.x:.2f},{self.y:.2f},{self.z:.2f}"
+        words = upper.split()
+        if not words:
+            return ""
+        if words[0] == "G28":
+            self.x, self.y, self.z = self.HOME
+        elif words[0] in ("G0", "G00", "G1", "G01"):
+            for word in words[1:]:
+                try:
+                    if word[0] == "X":
+                        self.x = float(word[1:])
+                    elif word[0] == "Y":
+                        self.y = float(word[1:])
+                    elif word[0] == "Z":
+                        self.z = float(word[1:])
+                except ValueError:
+                    pass
+        return "Ok"
+
+
+def _send_and_wait(ser, line: str, timeout: float) -> str:
+    """Write one line and wait for the robot's reply, like `send_gcode` in Auto_Connect.py."""
+    try:
+        ser.reset_input_buffer()
+    except Exception:
+        pass
+    ser.write((line + "\n").encode("utf-8"))
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        reply = ser.readline().decode("utf-8", errors="ignore").strip()
+        # Skip empty reads and a possible echo of the command
+        if reply and reply != line:
+            return reply
+    return ""
+
+
+def replay(
+    log: SessionLog,
+    target,
+    speed: float = 1.0,
+    start: float = 0.0,
+    end: Optional[float] = None,
+    reply_timeout: float = 30.0,
+) -> dict:
+    """Send the recorded commands of `log` to `target` with the recorded timing.
+
+    `target` is an open `serial.Serial` or an `EmulatedRobot`. `speed` scales the
+    timing (2.0 = twice as fast); 0 sends as fast as possible. Each command waits
+    for the robot's reply before the next one is sent, so the controller's input
+    is never overrun; the recorded timing is only a lower bound. Returns stats.
+    """
+    sent = 0
+    timeouts = 0
+    max_late = 0.0
+    t0_wall = time.monotonic()
+    t0_log: Optional[float] = None
+    for t, direction, line in log.records(start, end):
+        if direction != SENT:
+            continue
+        if t0_log is None:
+            t0_log = t
+        if speed > 0:
+            due = t0_wall + (t - t0_log) / speed
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                max_late = max(max_late, -wait)
+        if isinstance(target, EmulatedRobot):
+            target.handle(line)
+        elif not _send_and_wait(target, line, reply_timeout):
+            timeouts += 1
+        sent += 1
+    return {"sent": sent, "timeouts": timeouts, "elapsed": time.monotonic() - t0_wall, "max_late": max_late}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect or replay a Delta X session log.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_info = sub.add_parser("info", help="Show session summary")
+    p_info.add_argument("log")
+
+    p_dump = sub.add_parser("dump", help="Print records as text")
+    p_dump.add_argument("log")
+    p_dump.add_argument("--start", type=float, default=0.0, help="Seek to this many seconds")
+    p_dump.add_argument("--end", type=float, default=None)
+
+    p_replay = sub.add_parser("replay", help="Send recorded commands again")
+    p_replay.add_argument("log")
+    p_replay.add_argument("--port", help="Serial port, e.g. COM5 (default: emulated robot)")
+    p_replay.add_argument("--baud", type=int, default=115200)
+    p_replay.add_argument("--speed", type=float, default=1.0, help="1 = original, 2 = twice as fast, 0 = max")
+    p_replay.add_argument("--start", type=float, default=0.0)
+    p_replay.add_argument("--end", type=float, default=None)
+    p_replay.add_argument("--timeout", type=float, default=30.0, help="Max seconds to wait for each reply")
+
+    args = parser.parse_args()
+    with SessionLog(args.log) as log:
+        if args.command == "info":
+            counts = [0, 0]
+            for _, direction, _ in log.records():
+                counts[direction] += 1
+            print(f"Blocks: {log.block_count}")
+            print(f"Duration: {log.duration():.3f} s")
+            print(f"Sent: {counts[SENT]}  Received: {counts[RECEIVED]}")
+        elif args.command == "dump":
+            for t, direction, line in log.records(args.start, args.end):
+                print(f"{t:12.6f} {'>>' if direction == SENT else '<<'} {line}")
+        elif args.command == "replay":
+            if args.port:
+                import serial
+
+                target = serial.Serial(args.port, args.baud, timeout=1)
+                time.sleep(0.3)
+            else:
+                target = EmulatedRobot()
+            try:
+                stats = replay(log, target, args.speed, args.start, args.end, args.timeout)
+            finally:
+                if args.port:
+                    target.close()
+            print(
+                f"Replayed {stats['sent']} commands in {stats['elapsed']:.3f} s "
+                f"(max late {stats['max_late'] * 1000:.1f} ms, {stats['timeouts']} without reply)"
+            )
+
+
+if __name__ == "__main__":
+    main()